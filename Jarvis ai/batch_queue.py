@@ -0,0 +1,179 @@
+"""
+Deferred OpenAI requests for Jarvis via the Batch API.
+
+Prompts that don't need an answer right away are appended to a JSONL file in
+the Batch API input format. Once enough have accumulated (or the oldest has
+waited long enough) they are uploaded as one batch, which is billed at a lower
+rate and processed within 24 hours. A background thread polls submitted
+batches and stores the answers in a sqlite table keyed by prompt hash, where
+ai_response() finds them before making a synchronous call.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+
+PENDING_FILE = Path('pending_batch.jsonl')
+DB_FILE = Path('batch_results.db')
+ENDPOINT = '/v1/chat/completions'
+
+_DONE_STATUSES = ('completed', 'failed', 'expired', 'cancelled')
+
+
+class BatchQueue:
+    def __init__(self, client_factory, pending_path=PENDING_FILE, db_path=DB_FILE,
+                 min_batch=20, max_wait=3600, poll_interval=300, result_ttl=86400):
+        """`client_factory` returns an OpenAI client (or None if unavailable)."""
+        self.client_factory = client_factory
+        self.pending_path = Path(pending_path)
+        self.db_path = Path(db_path)
+        self.min_batch = min_batch
+        self.max_wait = max_wait
+        self.poll_interval = poll_interval
+        self.result_ttl = result_ttl
+        self._lock = threading.Lock()
+        self._db = None
+        self._thread = None
+        self._pending = set()
+        self._first_queued = None
+        self._submitting = False
+        if self.pending_path.exists():
+            for line in self.pending_path.read_text(encoding='utf-8').splitlines():
+                try:
+                    self._pending.add(json.loads(line)['custom_id'])
+                except Exception:
+                    continue
+            if self._pending:
+                self._first_queued = self.pending_path.stat().st_mtime
+        # Resume polling for batches submitted by an earlier run
+        if self._pending or (self.db_path.exists() and self._in_flight()):
+            self._start()
+
+    def _conn(self):
+        if self._db is None:
+            db = sqlite3.connect(str(self.db_path), check_same_thread=False)
+            db.execute('CREATE TABLE IF NOT EXISTS batch_results ('
+                       'prompt_hash TEXT PRIMARY KEY, response TEXT, created REAL)')
+            db.execute('CREATE TABLE IF NOT EXISTS batches ('
+                       'id TEXT PRIMARY KEY, status TEXT, submitted REAL)')
+            db.commit()
+            self._db = db
+        return self._db
+
+    def _in_flight(self):
+        with self._lock:
+            rows = self._conn().execute(
+                'SELECT id FROM batches WHERE status NOT IN (?, ?, ?, ?)', _DONE_STATUSES).fetchall()
+        return [r[0] for r in rows]
+
+    def lookup(self, key):
+        """Return the batch answer stored for `key` if younger than result_ttl, or None."""
+        if self._db is None and not self.db_path.exists():
+            return None
+        with self._lock:
+            row = self._conn().execute(
+                'SELECT response FROM batch_results WHERE prompt_hash = ? AND created >= ?',
+                [key, time.time() - self.result_ttl]).fetchone()
+        return row[0] if row else None
+
+    def enqueue(self, key, body):
+        """Queue a chat.completions request body under `key` (ignored if already queued)."""
+        with self._lock:
+            if key in self._pending:
+                return
+            line = {'custom_id': key, 'method': 'POST', 'url': ENDPOINT, 'body': body}
+            with open(self.pending_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(line) + '\n')
+            self._pending.add(key)
+            if self._first_queued is None:
+                self._first_queued = time.time()
+            due = len(self._pending) >= self.min_batch
+        if due:
+            self.submit()
+        self._start()
+
+    def submit(self):
+        """Upload everything pending as one batch. Returns the batch id, or None."""
+        client = self.client_factory()
+        if client is None:
+            return None
+        # Snapshot under the lock, upload without it so lookup() isn't blocked
+        # for the duration of the network calls
+        with self._lock:
+            if not self._pending or self._submitting:
+                return None
+            self._submitting = True
+            data = self.pending_path.read_bytes()
+            submitted = set(self._pending)
+        try:
+            try:
+                upload = client.files.create(file=(self.pending_path.name, data), purpose='batch')
+                batch = client.batches.create(input_file_id=upload.id, endpoint=ENDPOINT,
+                                              completion_window='24h')
+            except Exception as e:
+                logging.info(f'Batch submit error: {e}')
+                return None
+            with self._lock:
+                self._conn().execute('INSERT OR REPLACE INTO batches (id, status, submitted) VALUES (?, ?, ?)',
+                                     [batch.id, batch.status, time.time()])
+                self._conn().commit()
+                # enqueue() only appends, so anything queued during the upload
+                # is whatever follows the snapshot
+                rest = self.pending_path.read_bytes()[len(data):]
+                self._pending -= submitted
+                if rest:
+                    self.pending_path.write_bytes(rest)
+                    self._first_queued = time.time()
+                else:
+                    os.remove(self.pending_path)
+                    self._first_queued = None
+        finally:
+            self._submitting = False
+        logging.info(f'Submitted OpenAI batch {batch.id}.')
+        return batch.id
+
+    def poll(self):
+        """Check submitted batches once and store any finished results."""
+        client = self.client_factory()
+        if client is None:
+            return
+        for batch_id in self._in_flight():
+            try:
+                batch = client.batches.retrieve(batch_id)
+                results = []
+                if batch.status == 'completed' and batch.output_file_id:
+                    for line in client.files.content(batch.output_file_id).text.splitlines():
+                        item = json.loads(line)
+                        body = (item.get('response') or {}).get('body') or {}
+                        choices = body.get('choices') or []
+                        if choices:
+                            results.append((item['custom_id'], choices[0]['message']['content'], time.time()))
+            except Exception as e:
+                logging.info(f'Batch poll error for {batch_id}: {e}')
+                continue
+            with self._lock:
+                db = self._conn()
+                db.executemany('INSERT OR REPLACE INTO batch_results (prompt_hash, response, created) '
+                               'VALUES (?, ?, ?)', results)
+                db.execute('UPDATE batches SET status = ? WHERE id = ?', [batch.status, batch_id])
+                db.execute('DELETE FROM batch_results WHERE created < ?', [time.time() - self.result_ttl])
+                db.commit()
+            if batch.status in _DONE_STATUSES and batch.status != 'completed':
+                logging.info(f'OpenAI batch {batch_id} ended with status {batch.status}.')
+
+    def _run(self):
+        while True:
+            if self._first_queued is not None and time.time() - self._first_queued >= self.max_wait:
+                self.submit()
+            self.poll()
+            time.sleep(self.poll_interval)
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='jarvis-batch', daemon=True)
+                self._thread.start()
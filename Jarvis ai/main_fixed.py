@@ -3,7 +3,7 @@ Jarvis — Fixed and improved main assistant script
 - Safer config handling, helpful error messages
 - Cross-platform TTS init fallback
 - Optional SpeechRecognition (falls back to typed input)
-- Safer calculation using ast.literal_eval for arithmetic expressions
+- Safer calculation: plain arithmetic via a small tokenizer, AST-checked eval otherwise
 - OpenAI client support with robust response extraction
 - Persistent user profile (simple JSON memory)
 - Conversation history persisted (limited size)
@@ -19,67 +19,73 @@ Run: python main_fixed.py
 """
 
 import os
+import re
 import sys
 import json
+import operator
+import queue
+import random
 import logging
 import threading
-import datetime
 import time
+import atexit
+import copy
+import hashlib
+import functools
+import importlib
+import importlib.util
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Optional
 from pathlib import Path
 try:
     from dotenv import load_dotenv
 except Exception:
     load_dotenv = None
 
-# TTS
+# Fast JSON codec for persistence (falls back to the stdlib json module)
 try:
-    import pyttsx3
+    import orjson
 except Exception:
-    pyttsx3 = None
+    orjson = None
+
+def _json_loads(data):
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+def _json_dumps(obj, indent=False):
+    """Serialize to UTF-8 bytes, optionally indented for human inspection."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+    return json.dumps(obj, indent=2 if indent else None).encode('utf-8')
 
-# Optional speech recognition
+# TTS
 try:
-    import speech_recognition as sr
-    _HAS_SR = True
+    import pyttsx3
 except Exception:
-    sr = None
-    _HAS_SR = False
+    pyttsx3 = None
 
 # Other features
 import webbrowser
-import subprocess
-try:
-    import httpx
-except Exception:
-    httpx = None
-import requests
-import random
-import wikipedia
-try:
-    from newsapi import NewsApiClient
-except Exception:
-    NewsApiClient = None
-import pyjokes
-import schedule
-from googletrans import Translator
 import ast
+from semantic_cache import SemanticCache, is_volatile
+from batch_queue import BatchQueue
 
-# OpenAI (legacy and new client support)
-try:
-    import openai
-except Exception:
-    openai = None
-try:
-    from openai import OpenAI as OpenAIClient
-    _HAS_NEW_OPENAI_CLIENT = True
-except Exception:
-    OpenAIClient = None
-    _HAS_NEW_OPENAI_CLIENT = False
+# Heavy or rarely used third-party modules (speech_recognition, requests, httpx,
+# wikipedia, newsapi, pyjokes, openai) are imported on first use so start-up
+# only pays for what a session actually needs
+@functools.lru_cache(maxsize=None)
+def _get_module(name):
+    """Import `name` once and memoize it; returns None if it is not installed."""
+    try:
+        return importlib.import_module(name)
+    except Exception:
+        return None
 
 # Config & paths
 CONFIG_FILE = Path('config.json')
 USER_MEMORY_FILE = Path('user_profile.json')
 HISTORY_FILE = Path('history.json')
+RESPONSE_CACHE_FILE = Path('response_cache.json')
 
 # Logging (avoid logging secrets)
 logging.basicConfig(filename='jarvis_fixed.log', level=logging.INFO,
@@ -89,14 +95,48 @@ logging.basicConfig(filename='jarvis_fixed.log', level=logging.INFO,
 def safe_log(msg):
     logging.info(msg)
 
+# JSON files stay the source of truth; a sibling .msgpack snapshot of the parsed
+# data is kept alongside so repeat start-ups skip the JSON decode. The snapshot
+# records the exact mtime_ns, ctime_ns and size of the JSON it was built from and
+# is only used while all still match, so a restored file with its old mtime
+# preserved (cp -p, rsync, backups) doesn't slip through.
+# Note that config.msgpack holds the same secrets as config.json.
+def _source_id(st):
+    return [st.st_mtime_ns, st.st_ctime_ns, st.st_size]
+
+def _write_snapshot(path, data, st=None):
+    msgpack = _get_module('msgpack')
+    if msgpack is None:
+        return
+    try:
+        src = _source_id(st or path.stat())
+        with open(path.with_suffix('.msgpack'), 'wb') as f:
+            f.write(msgpack.packb({'src': src, 'data': data}, use_bin_type=True))
+    except Exception as e:
+        safe_log(f"Error writing snapshot for {path}: {e}")
+
+def _load_with_cache(path):
+    st = path.stat()
+    msgpack = _get_module('msgpack')
+    if msgpack is not None:
+        try:
+            with open(path.with_suffix('.msgpack'), 'rb') as f:
+                snap = msgpack.unpackb(f.read(), raw=False, strict_map_key=False)
+            if snap['src'] == _source_id(st):
+                return snap['data']
+        except Exception:
+            pass  # missing, stale-format or unreadable snapshot; rebuild from JSON
+    data = _json_loads(path.read_bytes())
+    _write_snapshot(path, data, st)
+    return data
+
 # Load config safely
 if not CONFIG_FILE.exists():
     print("config.json not found. Please create config.json with your settings.")
     sys.exit(1)
 
 try:
-    with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-        config = json.load(f)
+    config = _load_with_cache(CONFIG_FILE)
 except json.JSONDecodeError:
     print("config.json is malformed. Fix JSON formatting (no trailing commas).")
     sys.exit(1)
@@ -110,6 +150,78 @@ if required:
     print(f"Missing required config keys: {', '.join(required)}. Please update config.json.")
     sys.exit(1)
 
+# Immutable snapshot of the settings used on the hot path; built once so queries
+# read attributes instead of repeating config.get(...) with defaults
+@dataclass(frozen=True, slots=True)
+class Config:
+    openai_api_key: str
+    openai_model: str
+    enable_raptor: bool
+    openai_temperature: Optional[float]
+    weather_api_key: str
+    news_api_key: str
+    default_city: str
+    speech_rate: int
+    speech_volume: float
+    enable_response_cache: bool
+    enable_semantic_cache: bool
+    semantic_cache_threshold: float
+    semantic_cache_ttl: int
+    stream_responses: bool
+    context_turns: int
+    vosk_model_path: str
+    batch_min_size: int
+    batch_max_wait: int
+    batch_result_ttl: int
+
+    @property
+    def model(self):
+        return 'raptor-mini-preview' if self.enable_raptor else self.openai_model
+
+    @property
+    def cacheable(self):
+        # Non-zero temperature means replies are expected to vary; don't pin them
+        return not (self.openai_temperature or 0) > 0
+
+def build_config(data):
+    return Config(
+        openai_api_key=(data.get('openai_api_key') or '').strip(),
+        openai_model=data.get('openai_model', 'gpt-3.5-turbo'),
+        enable_raptor=bool(data.get('enable_raptor_mini_for_all_clients')),
+        openai_temperature=data.get('openai_temperature'),
+        weather_api_key=data.get('weather_api_key') or '',
+        news_api_key=data.get('news_api_key') or '',
+        default_city=data.get('default_city', 'Hyderabad'),
+        speech_rate=data.get('speech_rate', 170),
+        speech_volume=data.get('speech_volume', 0.9),
+        enable_response_cache=bool(data.get('enable_response_cache', True)),
+        enable_semantic_cache=bool(data.get('enable_semantic_cache', True)),
+        semantic_cache_threshold=data.get('semantic_cache_threshold', 0.90),
+        semantic_cache_ttl=data.get('semantic_cache_ttl', 86400),
+        stream_responses=bool(data.get('stream_responses', True)),
+        context_turns=int(data.get('context_turns', 0)),
+        vosk_model_path=data.get('vosk_model_path', 'model-en-us-small'),
+        batch_min_size=int(data.get('batch_min_size', 20)),
+        batch_max_wait=int(data.get('batch_max_wait', 3600)),
+        batch_result_ttl=int(data.get('batch_result_ttl', 86400)),
+    )
+
+CFG = build_config(config)
+
+def reload_config():
+    """Re-read config.json and swap in a fresh snapshot. Returns the new CFG."""
+    global config, CFG, _API_KEY, _API_KEY_PROBLEM
+    try:
+        data = _load_with_cache(CONFIG_FILE)
+    except Exception as e:
+        safe_log(f"Error reloading config: {e}")
+        return CFG
+    config = data
+    CFG = build_config(data)
+    _API_KEY = (os.environ.get('OPENAI_API_KEY') or CFG.openai_api_key).strip()
+    _API_KEY_PROBLEM = _api_key_problem(_API_KEY)
+    return CFG
+
 # Initialize TTS engine with platform fallback
 def init_tts():
     if not pyttsx3:
@@ -118,8 +230,8 @@ def init_tts():
     try:
         # On Windows prefer 'sapi5'; on other platforms default
         engine = pyttsx3.init('sapi5') if sys.platform.startswith('win') else pyttsx3.init()
-        engine.setProperty('rate', config.get('speech_rate', 170))
-        engine.setProperty('volume', config.get('speech_volume', 0.9))
+        engine.setProperty('rate', CFG.speech_rate)
+        engine.setProperty('volume', CFG.speech_volume)
         voices = engine.getProperty('voices')
         engine.setProperty('voice', voices[0].id if voices else '')
         return engine
@@ -138,7 +250,7 @@ if load_dotenv:
 
 # Validate key presence and log which source will be used
 _api_key_env = os.environ.get('OPENAI_API_KEY')
-_api_key_cfg = config.get('openai_api_key', '') if isinstance(config, dict) else ''
+_api_key_cfg = CFG.openai_api_key
 _api_key_final = (_api_key_env or _api_key_cfg or '').strip()
 
 if _api_key_final:
@@ -154,6 +266,20 @@ if _api_key_final:
 else:
     safe_log('OpenAI API key not found in environment or config.json at startup.')
 
+# The key is checked once here (and on reload_config), not on every AI call
+_PLACEHOLDER_RE = re.compile(r'(?i:^your_)|example')
+
+def _api_key_problem(key):
+    """Return 'missing', 'placeholder' or None for a usable key."""
+    if not key:
+        return 'missing'
+    if _PLACEHOLDER_RE.search(key) or (key.count('.') == 1 and 'openai' in key):
+        return 'placeholder'
+    return None
+
+_API_KEY = _api_key_final
+_API_KEY_PROBLEM = _api_key_problem(_API_KEY)
+
 # Speak helper (graceful fallback to print)
 def speak(text):
     if not text:
@@ -166,9 +292,59 @@ def speak(text):
     except Exception as e:
         safe_log(f"TTS error: {e}")
 
+# Offline recognition with Vosk when it and a model directory are available:
+# no network round-trip, and audio never leaves the machine
+_VOSK_RATE = 16000
+_VOSK_BLOCK = 8000  # frames per read (0.5 s)
+_VOSK_PHRASE_LIMIT = 10  # seconds
+
+@functools.lru_cache(maxsize=None)
+def _vosk_model():
+    vosk = _get_module('vosk')
+    if vosk is None or _get_module('sounddevice') is None:
+        return None
+    if not Path(CFG.vosk_model_path).is_dir():
+        safe_log(f'Vosk model not found at {CFG.vosk_model_path}; using speech_recognition.')
+        return None
+    try:
+        vosk.SetLogLevel(-1)
+        return vosk.Model(CFG.vosk_model_path)
+    except Exception as e:
+        safe_log(f'Vosk model load error: {e}')
+        return None
+
+def _listen_vosk(model):
+    # PortAudio buffers the microphone in its ring buffer; we drain it block by
+    # block and stop as soon as the recognizer reports a complete utterance
+    rec = _get_module('vosk').KaldiRecognizer(model, _VOSK_RATE)
+    print("Listening...")
+    deadline = time.monotonic() + _VOSK_PHRASE_LIMIT
+    with _get_module('sounddevice').RawInputStream(samplerate=_VOSK_RATE, blocksize=_VOSK_BLOCK,
+                                                   dtype='int16', channels=1) as stream:
+        while time.monotonic() < deadline:
+            data, _overflowed = stream.read(_VOSK_BLOCK)
+            if rec.AcceptWaveform(bytes(data)):
+                return _json_loads(rec.Result()).get('text', '')
+    return _json_loads(rec.FinalResult()).get('text', '')
+
 # Speech input with graceful fallback to typed input
 def take_command(retries=2):
-    if not _HAS_SR or sr is None:
+    model = _vosk_model()
+    if model is not None:
+        for attempt in range(retries):
+            try:
+                text = _listen_vosk(model)
+            except Exception as e:
+                safe_log(f"Vosk error: {e}")
+                return input("Microphone issue. Type command: ").strip().lower()
+            if text:
+                print("You said:", text)
+                return text.lower()
+            speak("Sorry, I didn't get that. Please repeat.")
+        return ''
+
+    sr = _get_module('speech_recognition')
+    if sr is None:
         return input("Type command: ").strip().lower()
 
     r = sr.Recognizer()
@@ -189,166 +365,647 @@ def take_command(retries=2):
             return input("Microphone issue. Type command: ").strip().lower()
     return ''
 
-# Safe calculation (ast.literal_eval limited to literals and tuples/lists/dicts)
+# Plain arithmetic (+ - * / % and parentheses) is evaluated by a shunting-yard
+# pass over regex tokens; anything else falls back to the AST-checked eval
+_CALC_SIMPLE_RE = re.compile(r'[\d\s.+\-*/()%]+')
+_CALC_TOKEN_RE = re.compile(r'\d+\.?\d*|\.\d+|[+\-*/()%]')
+_CALC_BINARY = {'+': (1, operator.add), '-': (1, operator.sub),
+                '*': (2, operator.mul), '/': (2, operator.truediv), '%': (2, operator.mod)}
+_CALC_UNARY = {'neg': operator.neg, 'pos': operator.pos}
+
+def _calc_apply(out, op):
+    if op in _CALC_UNARY:
+        out.append(_CALC_UNARY[op](out.pop()))
+    else:
+        b = out.pop()
+        a = out.pop()
+        out.append(_CALC_BINARY[op][1](a, b))
+
+def _calc(expr):
+    out, ops, prev = [], [], None
+    for tok in _CALC_TOKEN_RE.findall(expr):
+        if tok[0].isdigit() or tok[0] == '.':
+            out.append(float(tok) if '.' in tok else int(tok))
+        elif tok == '(':
+            ops.append(tok)
+        elif tok == ')':
+            while ops and ops[-1] != '(':
+                _calc_apply(out, ops.pop())
+            if not ops:
+                raise ValueError('Unbalanced parentheses')
+            ops.pop()
+        elif prev is None or prev == '(' or prev in _CALC_BINARY:
+            # Sign in operand position; binds tighter than any binary operator
+            if tok not in '+-':
+                raise ValueError('Unexpected operator')
+            ops.append('neg' if tok == '-' else 'pos')
+        else:
+            prec = _CALC_BINARY[tok][0]
+            while ops and ops[-1] != '(' and (ops[-1] in _CALC_UNARY or _CALC_BINARY[ops[-1]][0] >= prec):
+                _calc_apply(out, ops.pop())
+            ops.append(tok)
+        prev = tok
+    while ops:
+        op = ops.pop()
+        if op == '(':
+            raise ValueError('Unbalanced parentheses')
+        _calc_apply(out, op)
+    if len(out) != 1:
+        raise ValueError('Malformed expression')
+    return out[0]
+
+# Safe calculation (no names, calls or attribute access)
 def calculate(expression):
     try:
-        # Prevent names and calls by parsing expression AST and allowing only arithmetic
-        node = ast.parse(expression, mode='eval')
-        for sub in ast.walk(node):
-            if isinstance(sub, (ast.Call, ast.Name, ast.Attribute)):  # disallow these
-                raise ValueError('Unsupported expression')
-        result = eval(compile(node, '<string>', 'eval'))
+        if _CALC_SIMPLE_RE.fullmatch(expression) and '**' not in expression and '//' not in expression:
+            result = _calc(expression)
+        else:
+            # Prevent names and calls by parsing expression AST and allowing only arithmetic
+            node = ast.parse(expression, mode='eval')
+            for sub in ast.walk(node):
+                if isinstance(sub, (ast.Call, ast.Name, ast.Attribute)):  # disallow these
+                    raise ValueError('Unsupported expression')
+            result = eval(compile(node, '<string>', 'eval'))
         speak(f"The result is {result}")
     except Exception:
         speak('Sorry, I could not evaluate that expression safely.')
 
-# OpenAI wrapper
-def ai_response(prompt, history=None, max_tokens=200):
-    if history is None:
-        history = []
-    api_key = (os.environ.get('OPENAI_API_KEY') or config.get('openai_api_key') or '').strip()
-    if not api_key:
+# Exact-match response cache (LRU) so repeated prompts skip the OpenAI round-trip
+SYSTEM_PROMPT = "You are Jarvis, a helpful assistant."
+_RESPONSE_CACHE_MAX = 512
+_RESPONSE_CACHE = OrderedDict()
+_response_cache_lock = threading.Lock()
+
+def _response_cache_enabled():
+    return CFG.enable_response_cache and CFG.cacheable
+
+def _response_cache_key(model, prompt, max_tokens, context=''):
+    raw = f"{model}\x00{SYSTEM_PROMPT}\x00{context}\x00{prompt}\x00{max_tokens}".encode('utf-8')
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+def _response_cache_get(key):
+    with _response_cache_lock:
+        text = _RESPONSE_CACHE.get(key)
+        if text is not None:
+            _RESPONSE_CACHE.move_to_end(key)
+        return text
+
+def _response_cache_put(key, text):
+    if not text:
+        return
+    with _response_cache_lock:
+        _RESPONSE_CACHE[key] = text
+        _RESPONSE_CACHE.move_to_end(key)
+        while len(_RESPONSE_CACHE) > _RESPONSE_CACHE_MAX:
+            _RESPONSE_CACHE.popitem(last=False)
+
+def load_response_cache():
+    if RESPONSE_CACHE_FILE.exists():
+        try:
+            data = _json_loads(RESPONSE_CACHE_FILE.read_bytes())
+            with _response_cache_lock:
+                for key, text in list(data.items())[-_RESPONSE_CACHE_MAX:]:
+                    _RESPONSE_CACHE[key] = text
+        except Exception as e:
+            safe_log(f"Error loading response cache: {e}")
+
+def save_response_cache():
+    if not _response_cache_enabled():
+        return
+    try:
+        with _response_cache_lock:
+            data = dict(_RESPONSE_CACHE)
+        RESPONSE_CACHE_FILE.write_bytes(_json_dumps(data))
+    except Exception as e:
+        safe_log(f"Error saving response cache: {e}")
+
+if _response_cache_enabled():
+    load_response_cache()
+atexit.register(save_response_cache)
+
+# Semantic cache catches paraphrases of earlier prompts (optional dependencies)
+semantic_cache = None
+if CFG.enable_semantic_cache and CFG.cacheable:
+    semantic_cache = SemanticCache(threshold=CFG.semantic_cache_threshold,
+                                   ttl=CFG.semantic_cache_ttl)
+    if semantic_cache.available:
+        semantic_cache.warm()
+    else:
+        semantic_cache = None
+
+def _cache_user():
+    return user_profile.get('name', 'default')
+
+def _cache_response(cache_key, prompt, text, contextual=False):
+    if cache_key is None:
+        return
+    _response_cache_put(cache_key, text)
+    if semantic_cache is not None and not contextual:
+        semantic_cache.store(prompt, text, user=_cache_user())
+
+# Shared HTTP connections: created on first use and reused, so repeat calls
+# keep the pooled TCP/TLS connection alive instead of handshaking every time
+@functools.lru_cache(maxsize=None)
+def _httpx_client():
+    httpx = _get_module('httpx')
+    if httpx is None:
+        return None
+    return httpx.Client(timeout=30.0,
+                        http2=importlib.util.find_spec('h2') is not None,
+                        limits=httpx.Limits(max_keepalive_connections=8))
+
+@functools.lru_cache(maxsize=None)
+def _requests_session():
+    return _get_module('requests').Session()
+
+@functools.lru_cache(maxsize=4)
+def _openai_client(api_key):
+    OpenAIClient = getattr(_get_module('openai'), 'OpenAI', None)
+    if OpenAIClient is None:
+        return None
+    # Pass our own httpx client into the OpenAI client to avoid the
+    # `Client.__init__() got an unexpected keyword argument 'proxies'` error
+    # that happens when the OpenAI client constructs its own httpx.Client
+    # with extra kwargs. If httpx is not available, construct it directly.
+    http_client = _httpx_client()
+    try:
+        if http_client is not None:
+            return OpenAIClient(api_key=api_key, http_client=http_client)
+        return OpenAIClient(api_key=api_key)
+    except TypeError:
+        # Some OpenAIClient versions use a different constructor
+        # signature; fall back to the simple form.
+        return OpenAIClient(api_key=api_key)
+
+def _close_http():
+    if _httpx_client.cache_info().currsize and _httpx_client() is not None:
+        _httpx_client().close()
+    if _requests_session.cache_info().currsize:
+        _requests_session().close()
+
+atexit.register(_close_http)
+
+# Fixed part of every request, built once
+_SYSTEM_MSG = {"role": "system", "content": SYSTEM_PROMPT}
+
+def trim_messages(history, turns=3):
+    """Turn the last `turns` answered exchanges in history into chat messages.
+
+    A turn is a user entry followed directly by a non-empty Jarvis reply; user
+    entries that were handled locally (or are still awaiting an answer) and
+    stray Jarvis lines such as greetings are skipped.
+    """
+    entries = list(history)
+    pairs = []
+    i = len(entries) - 1
+    while i > 0 and len(pairs) < turns:
+        reply, asked = entries[i].get('jarvis'), entries[i - 1].get('user')
+        if reply and asked:
+            pairs.append(({"role": "user", "content": asked},
+                          {"role": "assistant", "content": reply}))
+            i -= 2
+        else:
+            i -= 1
+    return [msg for pair in reversed(pairs) for msg in pair]
+
+# Lines shorter than this are cheaper to resend than to reference
+_DEDUP_MIN_LINE = 40
+
+def _line_id(line):
+    return hashlib.blake2b(line.encode('utf-8'), digest_size=4).hexdigest()
+
+# Added to the system message whenever dedupe_messages() emits references
+_DEDUP_NOTE = ('Earlier messages are abbreviated: a line tagged [#id] is quoted in '
+               'full once, and [REF#id] later stands for that same line.')
+
+def dedupe_messages(messages):
+    """Send each long line of the earlier turns once: its first occurrence is
+    tagged [#id] and later repeats become [REF#id], so repeated
+    pastes/instructions aren't re-billed. The last (current) message is
+    always sent verbatim, and the notation is explained in the system message."""
+    *earlier, current = messages
+    counts = {}
+    for msg in earlier:
+        for line in msg['content'].split('\n'):
+            if len(line) >= _DEDUP_MIN_LINE:
+                key = _line_id(line)
+                counts[key] = counts.get(key, 0) + 1
+    if all(n == 1 for n in counts.values()):
+        return messages
+    seen = set()
+    out = []
+    for msg in earlier:
+        lines = msg['content'].split('\n')
+        for i, line in enumerate(lines):
+            if len(line) < _DEDUP_MIN_LINE:
+                continue
+            key = _line_id(line)
+            if counts[key] == 1:
+                continue
+            if key in seen:
+                lines[i] = f'[REF#{key}]'
+            else:
+                seen.add(key)
+                lines[i] = f'[#{key}] {line}'
+        out.append({**msg, "content": '\n'.join(lines)})
+    if out and out[0]['role'] == 'system':
+        out[0] = {**out[0], "content": f"{out[0]['content']}\n{_DEDUP_NOTE}"}
+    return [*out, current]
+
+def _extract_text(response):
+    # New client chat shape
+    try:
+        return response.choices[0].message.content
+    except Exception:
+        pass
+    text = ''
+    try:
+        # Responses API shape
+        if hasattr(response, 'output'):
+            out = response.output
+            if isinstance(out, list) and out:
+                first = out[0]
+                if isinstance(first, dict) and 'content' in first:
+                    content = first['content']
+                    if isinstance(content, list) and len(content)>0:
+                        c0 = content[0]
+                        if isinstance(c0, dict) and 'text' in c0:
+                            text = c0['text']
+    except Exception:
+        text = str(response)
+    return text
+
+def _chat_new(api_key, model, messages, max_tokens, extra):
+    response = _openai_client(api_key).chat.completions.create(
+        model=model,
+        messages=messages,
+        max_tokens=max_tokens,
+        **extra,
+    )
+    return _extract_text(response)
+
+# A sentence is complete once its terminator is followed by whitespace
+_SENTENCE_END_RE = re.compile(r'[.!?]\s')
+
+def _chat_new_streaming(api_key, model, messages, max_tokens, extra):
+    """Stream the reply and speak each sentence as soon as it is complete.
+
+    A reader thread pulls tokens off the HTTP stream while this thread is busy
+    in the TTS engine, so synthesis overlaps with generation. Returns
+    (text, complete): the spoken text, and False if the stream broke part-way.
+    """
+    stream = _openai_client(api_key).chat.completions.create(
+        model=model,
+        messages=messages,
+        max_tokens=max_tokens,
+        stream=True,
+        **extra,
+    )
+    sentences = queue.Queue()
+
+    def reader():
+        buf = ''
+        try:
+            for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if not delta:
+                    continue
+                buf += delta
+                cut = 0
+                for m in _SENTENCE_END_RE.finditer(buf):
+                    cut = m.end()
+                if cut:
+                    sentences.put(buf[:cut])
+                    buf = buf[cut:]
+            if buf.strip():
+                sentences.put(buf)
+        except Exception as e:
+            sentences.put(e)
+        finally:
+            sentences.put(None)
+
+    threading.Thread(target=reader, name='jarvis-stream', daemon=True).start()
+    spoken = []
+    complete = True
+    while True:
+        item = sentences.get()
+        if item is None:
+            break
+        if isinstance(item, Exception):
+            if not spoken:
+                raise item
+            # Part of the reply was already spoken; keep it rather than retrying
+            safe_log(f'OpenAI stream interrupted: {item}')
+            complete = False
+            break
+        speak(item.strip())
+        spoken.append(item)
+    return ''.join(spoken).strip(), complete
+
+def _chat_legacy(api_key, model, messages, max_tokens, extra):
+    openai = _get_module('openai')
+    openai.api_key = api_key
+    resp = openai.ChatCompletion.create(
+        model=model,
+        messages=messages,
+        max_tokens=max_tokens,
+        **extra
+    )
+    return resp.choices[0].message.get('content') if hasattr(resp.choices[0].message, 'get') else resp.choices[0].message.content
+
+@functools.lru_cache(maxsize=None)
+def _chat_impl():
+    """Pick the chat function for the installed SDK once (None if openai is missing)."""
+    openai = _get_module('openai')
+    if openai is None:
+        return None
+    return _chat_new if getattr(openai, 'OpenAI', None) is not None else _chat_legacy
+
+def _api_key_unusable():
+    """Speak why the OpenAI key can't be used and return True, or return False."""
+    if _API_KEY_PROBLEM == 'missing':
         speak('OpenAI API key not set in config.json or environment variables.')
-        return ""
+        return True
     # Avoid calling the OpenAI service when the config contains a placeholder value
-    if api_key.upper().startswith('YOUR_') or 'example' in api_key or api_key.count('.') == 1 and 'openai' in api_key:
+    if _API_KEY_PROBLEM == 'placeholder':
         speak('OpenAI API key appears to be a placeholder; set a real API key to enable AI responses.')
+        return True
+    return False
+
+# OpenAI wrapper
+def ai_response(prompt, history=None, max_tokens=200, no_cache=False):
+    if history is None:
+        history = []
+    api_key = _API_KEY
+    if _api_key_unusable():
         return ""
 
+    # Optional conversation context: the last few answered exchanges. The
+    # current prompt (already recorded by process_query) has no reply yet, so
+    # trim_messages leaves it out
+    context = []
+    if CFG.context_turns and history:
+        context = trim_messages(history, CFG.context_turns)
+    context_text = '\x01'.join(m['content'] for m in context)
+
+    model = get_current_model()
+    use_cache = _response_cache_enabled() and not no_cache and not is_volatile(prompt)
+    cache_key = _response_cache_key(model, prompt, max_tokens, context_text) if use_cache else None
+    if use_cache:
+        cached = _response_cache_get(cache_key)
+        if cached is not None:
+            safe_log('Response cache hit.')
+        elif semantic_cache is not None and not context:
+            # Not promoted into the exact cache, which has no TTL or user and
+            # would keep serving the answer after semantic_cache_ttl
+            cached = semantic_cache.lookup(prompt, user=_cache_user())
+            if cached is not None:
+                safe_log('Semantic cache hit.')
+        if cached is None and not context:
+            # Answer left behind by an earlier ai_response_deferred() batch
+            cached = _batch_queue().lookup(cache_key)
+            if cached is not None:
+                safe_log('Batch result hit.')
+                _cache_response(cache_key, prompt, cached)
+        if cached is not None:
+            speak(cached)
+            return cached
+
+    chat = _chat_impl()
+    if chat is None:
+        speak('OpenAI SDK not available. Install openai package.')
+        return ''
+
+    # Optional sampling temperature; only sent when configured
+    extra = {}
+    if CFG.openai_temperature is not None:
+        extra['temperature'] = CFG.openai_temperature
+    messages = [_SYSTEM_MSG, {"role": "user", "content": prompt}]
+    if context:
+        messages = dedupe_messages([_SYSTEM_MSG, *context, messages[-1]])
+
     # Avoid writing API key to logs
     safe_log('Calling OpenAI API (masked key).')
 
-    # Try to use new OpenAI client if available; if it fails, fall back to the legacy openai SDK
+    # Streaming speaks as it goes; every other path speaks the full text at the end
+    streamed = chat is _chat_new and CFG.stream_responses
+    complete = True
     try:
-        if _HAS_NEW_OPENAI_CLIENT and OpenAIClient is not None:
-            try:
-                # Create an httpx client and pass it into the OpenAI client to
-                # avoid the `Client.__init__() got an unexpected keyword argument 'proxies'`
-                # error that happens when the OpenAI client tries to construct
-                # its own httpx.Client with extra kwargs. If httpx is not
-                # available, fall back to direct construction.
-                try:
-                    if httpx is not None:
-                        http_client = httpx.Client()
-                        client = OpenAIClient(api_key=api_key, http_client=http_client)
-                    else:
-                        client = OpenAIClient(api_key=api_key)
-                except TypeError:
-                    # Some OpenAIClient versions use a different constructor
-                    # signature; fall back to the simple form.
-                    client = OpenAIClient(api_key=api_key)
-
-                model = config.get('openai_model', 'gpt-3.5-turbo')
-                if config.get('enable_raptor_mini_for_all_clients'):
-                    model = 'raptor-mini-preview'
-                response = client.chat.completions.create(
-                    model=model,
-                    messages=[{"role": "system", "content": "You are Jarvis, a helpful assistant."},
-                              {"role": "user", "content": prompt}],
-                    max_tokens=max_tokens,
-                )
-                # New client chat shape
-                text = ''
-                try:
-                    text = response.choices[0].message.content
-                except Exception:
-                    try:
-                        # Responses API shape
-                        if hasattr(response, 'output'):
-                            out = response.output
-                            if isinstance(out, list) and out:
-                                first = out[0]
-                                if isinstance(first, dict) and 'content' in first:
-                                    content = first['content']
-                                    if isinstance(content, list) and len(content)>0:
-                                        c0 = content[0]
-                                        if isinstance(c0, dict) and 'text' in c0:
-                                            text = c0['text']
-                    except Exception:
-                        text = str(response)
-                speak(text)
-                return text
-            except Exception as e:
-                # If the new client fails for any reason, inspect the error.
-                msg = str(e)
-                safe_log(f'New OpenAI client error: {msg} � evaluating fallback.')
-                low = msg.lower()
-                # Authentication / invalid key
-                if 'invalid_api_key' in low or 'incorrect api key' in low or '401' in low:
-                    safe_log('Detected invalid OpenAI API key (401). Aborting request.')
-                    speak('OpenAI API key appears to be invalid or revoked. Please set a valid key in the environment variable `OPENAI_API_KEY` or in `config.json`.')
-                    return ''
-                # Quota / rate limit
-                if 'quota' in low or '429' in low or 'rate limit' in low:
-                    safe_log('Detected OpenAI quota / rate limit error.')
-                    speak('OpenAI API quota exceeded or rate limited. Check your account usage or try again later.')
-                    return ''
-                # For other errors, continue to attempt the legacy SDK fallback
-                safe_log('New OpenAI client error not recognized as auth/quota; falling back to legacy openai SDK.')
-
-        # Legacy openai python package (fallback or if new client not available)
-        if openai is None:
-            speak('OpenAI SDK not available. Install openai package.')
+        if streamed:
+            text, complete = _chat_new_streaming(api_key, model, messages, max_tokens, extra)
+        else:
+            text = chat(api_key, model, messages, max_tokens, extra)
+    except Exception as e:
+        streamed = False
+        if chat is not _chat_new:
+            safe_log(f"OpenAI error: {e}")
+            speak('Sorry, I could not reach the AI service.')
             return ''
-        openai.api_key = api_key
-        model = config.get('openai_model', 'gpt-3.5-turbo')
-        if config.get('enable_raptor_mini_for_all_clients'):
-            model = 'raptor-mini-preview'
-        resp = openai.ChatCompletion.create(
-            model=model,
-            messages=[{"role": "system", "content": "You are Jarvis, a helpful assistant."},
-                      {"role": "user", "content": prompt}],
-            max_tokens=max_tokens
-        )
-        text = resp.choices[0].message.get('content') if hasattr(resp.choices[0].message, 'get') else resp.choices[0].message.content
+        # If the new client fails for any reason, inspect the error.
+        msg = str(e)
+        safe_log(f'New OpenAI client error: {msg} - evaluating fallback.')
+        low = msg.lower()
+        # Authentication / invalid key
+        if 'invalid_api_key' in low or 'incorrect api key' in low or '401' in low:
+            safe_log('Detected invalid OpenAI API key (401). Aborting request.')
+            speak('OpenAI API key appears to be invalid or revoked. Please set a valid key in the environment variable `OPENAI_API_KEY` or in `config.json`.')
+            return ''
+        # Quota / rate limit
+        if 'quota' in low or '429' in low or 'rate limit' in low:
+            safe_log('Detected OpenAI quota / rate limit error.')
+            speak('OpenAI API quota exceeded or rate limited. Check your account usage or try again later.')
+            return ''
+        # For other errors, attempt the legacy SDK fallback
+        safe_log('New OpenAI client error not recognized as auth/quota; falling back to legacy openai SDK.')
+        try:
+            text = _chat_legacy(api_key, model, messages, max_tokens, extra)
+        except Exception as e:
+            safe_log(f"OpenAI error: {e}")
+            speak('Sorry, I could not reach the AI service.')
+            return ''
+
+    # A reply cut short mid-stream must not be served again from the caches
+    if complete:
+        _cache_response(cache_key, prompt, text, contextual=bool(context))
+    if not streamed:
         speak(text)
+    return text
+
+@functools.lru_cache(maxsize=None)
+def _batch_queue():
+    return BatchQueue(lambda: None if _API_KEY_PROBLEM else _openai_client(_API_KEY),
+                      min_batch=CFG.batch_min_size, max_wait=CFG.batch_max_wait,
+                      result_ttl=CFG.batch_result_ttl)
+
+def ai_response_deferred(prompt, max_tokens=200):
+    """Queue a low-priority prompt for the OpenAI Batch API (cheaper, answered
+    within 24h). Returns the answer if a finished batch already has it, None
+    once queued, or "" (after speaking why) when no usable API key is set; once
+    it arrives, ai_response() for the same prompt returns it directly."""
+    if _api_key_unusable():
+        return ""
+    model = get_current_model()
+    key = _response_cache_key(model, prompt, max_tokens)
+    batches = _batch_queue()
+    text = batches.lookup(key)
+    if text is not None:
         return text
-    except Exception as e:
-        safe_log(f"OpenAI error: {e}")
-        speak('Sorry, I could not reach the AI service.')
-        return ''
+    body = {"model": model, "messages": [_SYSTEM_MSG, {"role": "user", "content": prompt}],
+            "max_tokens": max_tokens}
+    if CFG.openai_temperature is not None:
+        body['temperature'] = CFG.openai_temperature
+    batches.enqueue(key, body)
+    return None
+
+# Background writer: disk writes handed to it never block the caller, and
+# writes queued for the same file before it runs collapse into the latest one
+_pending_writes = {}
+_pending_lock = threading.Lock()
+_pending_event = threading.Event()
+_write_lock = threading.Lock()
+_writer_thread = None
+
+def drain_writes():
+    """Run all queued writes now on the calling thread."""
+    # Hold the write lock before taking jobs, so an exit-time drain waits for
+    # jobs the writer thread has already claimed instead of finding none
+    with _write_lock:
+        with _pending_lock:
+            jobs = list(_pending_writes.values())
+            _pending_writes.clear()
+            _pending_event.clear()
+        for fn, data in jobs:
+            fn(data)
+
+def _writer_loop():
+    while True:
+        _pending_event.wait()
+        drain_writes()
+
+def submit_write(key, fn, data):
+    """Queue fn(data) on the writer thread; a newer job for `key` replaces an older one."""
+    global _writer_thread
+    with _pending_lock:
+        _pending_writes[key] = (fn, data)
+        _pending_event.set()
+        if _writer_thread is None:
+            _writer_thread = threading.Thread(target=_writer_loop, name='jarvis-writer', daemon=True)
+            _writer_thread.start()
+
+atexit.register(drain_writes)
 
 # Simple user profile persistence
 def load_user_profile():
     if USER_MEMORY_FILE.exists():
         try:
-            with open(USER_MEMORY_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            return _load_with_cache(USER_MEMORY_FILE)
         except Exception:
             return {}
     return {}
 
 def save_user_profile(profile):
     try:
-        with open(USER_MEMORY_FILE, 'w', encoding='utf-8') as f:
-            json.dump(profile, f, indent=2)
+        USER_MEMORY_FILE.write_bytes(_json_dumps(profile, indent=True))
+        _write_snapshot(USER_MEMORY_FILE, profile)
     except Exception as e:
         safe_log(f"Error saving profile: {e}")
 
+def save_user_profile_async(profile):
+    # Copy so later in-place edits don't race with the background write
+    submit_write(USER_MEMORY_FILE, save_user_profile, copy.deepcopy(profile))
+
 user_profile = load_user_profile()
 
 # Conversation history persisted (small)
+HISTORY_MAX = 50
+_HISTORY_FLUSH_INTERVAL = 2.0  # seconds; turns inside this window share one write
+_history_dirty = threading.Event()
+_history_save_lock = threading.Lock()
+_history_timer_lock = threading.Lock()
+
 def load_history():
     if HISTORY_FILE.exists():
         try:
-            with open(HISTORY_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            return deque(_load_with_cache(HISTORY_FILE), maxlen=HISTORY_MAX)
         except Exception:
-            return []
-    return []
+            return deque(maxlen=HISTORY_MAX)
+    return deque(maxlen=HISTORY_MAX)
 
 def save_history(history):
+    # Write to a temp file and swap it in so readers never see a partial file
     try:
-        with open(HISTORY_FILE, 'w', encoding='utf-8') as f:
-            json.dump(history[-50:], f, indent=2)
+        recent = list(history)
+        tmp = HISTORY_FILE.with_suffix('.json.tmp')
+        with _history_save_lock:
+            tmp.write_bytes(_json_dumps(recent, indent=True))
+            os.replace(tmp, HISTORY_FILE)
+            _write_snapshot(HISTORY_FILE, recent)
     except Exception as e:
         safe_log(f"Error saving history: {e}")
 
+def flush_history():
+    """Write pending history to disk now (no-op if nothing changed)."""
+    if _history_dirty.is_set():
+        _history_dirty.clear()
+        save_history(history)
+
+def mark_history_dirty():
+    """Schedule a history write at most once per flush interval."""
+    with _history_timer_lock:
+        if _history_dirty.is_set():
+            return
+        _history_dirty.set()
+        timer = threading.Timer(_HISTORY_FLUSH_INTERVAL, flush_history)
+        timer.daemon = True
+        timer.start()
+
+def add_history(role, text, ts=None):
+    """Append one turn; the bounded deque drops the oldest and the write is debounced."""
+    history.append({role: text, 'time': ts if ts is not None else time.time()})
+    mark_history_dirty()
+
 history = load_history()
+atexit.register(flush_history)
+
+# Short-lived cache for weather/news lookups: wish_me() warms it in the
+# background, and repeat queries within the TTL skip the HTTP round-trip
+_LOOKUP_TTL = 600  # seconds
+_LOOKUP_MAX = 32
+_lookup_cache = {}
+_lookup_lock = threading.Lock()
+
+def _cached_lookup(key, fetch):
+    """Return fetch() for `key`, reusing a result younger than the TTL. None is not cached."""
+    now = time.time()
+    with _lookup_lock:
+        hit = _lookup_cache.get(key)
+    if hit and now - hit[0] < _LOOKUP_TTL:
+        return hit[1]
+    data = fetch()
+    if data is not None:
+        with _lookup_lock:
+            _lookup_cache[key] = (now, data)
+            if len(_lookup_cache) > _LOOKUP_MAX:
+                del _lookup_cache[min(_lookup_cache, key=lambda k: _lookup_cache[k][0])]
+    return data
+
+def _prefetch():
+    if CFG.weather_api_key:
+        try:
+            _weather_data(CFG.default_city)
+        except Exception as e:
+            safe_log(f'Weather prefetch error: {e}')
+    if CFG.news_api_key:
+        try:
+            _headlines()
+        except Exception as e:
+            safe_log(f'News prefetch error: {e}')
 
 # Lightweight helpers
 def wish_me():
-    hour = datetime.datetime.now().hour
+    # Warm the weather/news cache while the greeting is being spoken
+    threading.Thread(target=_prefetch, name='jarvis-prefetch', daemon=True).start()
+    hour = time.localtime().tm_hour
     if hour < 12:
         speak('Good morning!')
     elif hour < 18:
@@ -366,20 +1023,26 @@ def open_website(site):
     speak(f'Opened {site}')
 
 def tell_time():
-    speak(datetime.datetime.now().strftime('%H:%M:%S'))
+    speak(time.strftime('%H:%M:%S'))
 
 # Weather
+def _weather_data(city):
+    # Returns the OpenWeatherMap payload, or None when the city/API lookup failed
+    def fetch():
+        url = f'https://api.openweathermap.org/data/2.5/weather?q={city}&appid={CFG.weather_api_key}&units=metric'
+        data = _requests_session().get(url, timeout=10).json()
+        return data if data.get('cod') == 200 else None
+    return _cached_lookup(('weather', city.lower()), fetch)
+
 def get_weather(city=None):
-    api_key = config.get('weather_api_key')
+    api_key = CFG.weather_api_key
     if not api_key:
         speak('Weather API key not set in config.')
         return
-    city = city or config.get('default_city', 'Hyderabad')
+    city = city or CFG.default_city
     try:
-        url = f'https://api.openweathermap.org/data/2.5/weather?q={city}&appid={api_key}&units=metric'
-        r = requests.get(url, timeout=10)
-        data = r.json()
-        if data.get('cod') == 200:
+        data = _weather_data(city)
+        if data is not None:
             t = data['main']['temp']
             desc = data['weather'][0]['description']
             speak(f'The weather in {city} is {desc} with {t}°C')
@@ -390,18 +1053,27 @@ def get_weather(city=None):
         speak('Could not fetch weather at this time.')
 
 # News
+def _headlines():
+    # Top five articles, or None when the client is missing or nothing came back
+    NewsApiClient = getattr(_get_module('newsapi'), 'NewsApiClient', None)
+    if NewsApiClient is None:
+        return None
+    def fetch():
+        top = NewsApiClient(api_key=CFG.news_api_key).get_top_headlines(language='en', country='us')
+        return top.get('articles', [])[:5] or None
+    return _cached_lookup('news', fetch)
+
 def get_news():
-    api_key = config.get('news_api_key')
+    api_key = CFG.news_api_key
     if not api_key:
         speak('News API key not set in config.')
         return
+    NewsApiClient = getattr(_get_module('newsapi'), 'NewsApiClient', None)
     if NewsApiClient is None:
         speak('News API client library is not installed. Please install newsapi-python.')
         return
     try:
-        newsapi = NewsApiClient(api_key=api_key)
-        top = newsapi.get_top_headlines(language='en', country='us')
-        articles = top.get('articles', [])[:5]
+        articles = _headlines()
         if not articles:
             speak('No news found.')
             return
@@ -412,81 +1084,119 @@ def get_news():
         safe_log(f'News error: {e}')
         speak('Could not fetch news.')
 
+# Wikipedia summaries and the joke list are memoized: repeat topics skip the
+# HTTP call and jokes come from one preloaded pool
+@functools.lru_cache(maxsize=256)
+def _wiki(topic, sentences=2):
+    return _get_module('wikipedia').summary(topic, sentences=sentences)
+
+@functools.lru_cache(maxsize=None)
+def _joke_pool():
+    return tuple(_get_module('pyjokes').get_jokes())
+
 def tell_joke():
     try:
-        speak(pyjokes.get_joke())
+        speak(random.choice(_joke_pool()))
     except Exception as e:
         safe_log(f'Joke error: {e}')
         speak('Sorry, I could not fetch a joke right now.')
 
 def get_current_model():
-    model = config.get('openai_model', 'gpt-3.5-turbo')
-    if config.get('enable_raptor_mini_for_all_clients'):
-        model = 'raptor-mini-preview'
-    return model
+    return CFG.model
+
+# Intent handlers; each receives the regex match against the lower-cased query
+def _intent_wikipedia(m):
+    topic = m.string.replace('wikipedia', '').strip() or m.string
+    speak('Searching Wikipedia...')
+    try:
+        s = _wiki(topic)
+        speak(s)
+    except Exception:
+        speak('Could not fetch from Wikipedia.')
+
+def _intent_open(m):
+    site = m.string.replace('open website', '').replace('open', '').strip()
+    open_website(site)
+
+def _intent_weather(m):
+    city = m.group('city')
+    get_weather(city.strip() if city else None)
+
+def _intent_set_name(m):
+    name = m.group('name').strip()
+    user_profile['name'] = name
+    save_user_profile_async(user_profile)
+    speak(f'Okay, I will call you {name}.')
+
+def _intent_train_profile(m):
+    speak('Tell me the facts you want me to remember. Say "done" when finished.')
+    facts = []
+    while True:
+        f = take_command()
+        if f.strip().lower() in ('done', 'nothing'):
+            break
+        facts.append(f)
+    user_profile.setdefault('notes', []).extend(facts)
+    save_user_profile_async(user_profile)
+    speak('Saved your profile notes.')
+
+def _intent_daily_summary(m):
+    # Not urgent, so it goes through the cheaper Batch API. The prompt is fixed
+    # per day in the profile so asking again later finds the finished answer.
+    today = time.strftime('%Y-%m-%d')
+    pending = user_profile.get('daily_summary') or {}
+    if pending.get('date') != today:
+        asked = [e['user'] for e in history
+                 if e.get('user') and time.strftime('%Y-%m-%d', time.localtime(e.get('time', 0))) == today]
+        prompt = (f'Write a short end-of-day summary for {today} of what I asked my assistant today:\n'
+                  + '\n'.join(f'- {q}' for q in asked))
+        pending = {'date': today, 'prompt': prompt}
+        user_profile['daily_summary'] = pending
+        save_user_profile_async(user_profile)
+    text = ai_response_deferred(pending['prompt'])
+    if text:
+        speak(text)
+    elif text is None:
+        speak("I've queued today's summary. Ask me again later and it should be ready.")
+
+def _intent_exit(m):
+    speak('Goodbye!')
+    sys.exit(0)
+
+# Deterministic commands, checked in order; a query matching none goes to the AI
+_INTENTS = [
+    (re.compile(r'wikipedia'), _intent_wikipedia),
+    (re.compile(r'^open |open website'), _intent_open),
+    (re.compile(r'\btime\b'), lambda m: tell_time()),
+    (re.compile(r'\bweather\b(?:.*\bin\s+(?P<city>[\w\s]+))?'), _intent_weather),
+    (re.compile(r'^(?:calculate|what is)(?P<expr>.*)'), lambda m: calculate(m.group('expr').strip())),
+    (re.compile(r'\bnews\b'), lambda m: get_news()),
+    (re.compile(r'\b(?:daily summary|end of day summary|summari[sz]e my day)\b'), _intent_daily_summary),
+    (re.compile(r'\bhelp\b'), lambda m: speak('Available commands: wikipedia, open <site>, time, weather, calculate, news, joke, set my name to <name>, who am i, train my profile, daily summary, exit.')),
+    (re.compile(r'\bjoke'), lambda m: tell_joke()),
+    (re.compile(r'^set my name to(?P<name>.*)'), _intent_set_name),
+    (re.compile(r'\bwho am i\b'), lambda m: speak(f'You are {user_profile.get("name", "not set")}')),
+    (re.compile(r'(?=.*train)(?=.*profile)'), _intent_train_profile),
+    (re.compile(r'^(?:exit|quit|bye)$'), _intent_exit),
+]
 
 # Main processing
 def process_query(query):
     if not query:
         return
     q = query.lower()
-    history.append({'user': query, 'time': time.time()})
-    save_history(history)
+    now = time.time()
+    add_history('user', query, now)
 
-    if 'wikipedia' in q:
-        topic = q.replace('wikipedia', '').strip() or q
-        speak('Searching Wikipedia...')
-        try:
-            s = wikipedia.summary(topic, sentences=2)
-            speak(s)
-        except Exception:
-            speak('Could not fetch from Wikipedia.')
-    elif 'open website' in q or q.startswith('open '):
-        site = q.replace('open website', '').replace('open', '').strip()
-        open_website(site)
-    elif 'time' in q:
-        tell_time()
-    elif 'weather' in q:
-        city = None
-        if 'in ' in q:
-            city = q.split('in')[-1].strip()
-        get_weather(city)
-    elif q.startswith('calculate') or q.startswith('what is'):
-        expr = q.replace('calculate', '').replace('what is', '').strip()
-        calculate(expr)
-    elif 'news' in q:
-        get_news()
-    elif 'help' in q:
-        speak('Available commands: wikipedia, open <site>, time, weather, calculate, news, joke, set my name to <name>, who am i, train my profile, exit.')
-    elif 'joke' in q:
-        tell_joke()
-    elif q.startswith('set my name to'):
-        name = q.replace('set my name to', '').strip()
-        user_profile['name'] = name
-        save_user_profile(user_profile)
-        speak(f'Okay, I will call you {name}.')
-    elif 'who am i' in q:
-        speak(f'You are {user_profile.get("name", "not set")}')
-    elif 'train' in q and 'profile' in q:
-        speak('Tell me the facts you want me to remember. Say "done" when finished.')
-        facts = []
-        while True:
-            f = take_command()
-            if f.strip().lower() in ('done', 'nothing'):
-                break
-            facts.append(f)
-        user_profile.setdefault('notes', []).extend(facts)
-        save_user_profile(user_profile)
-        speak('Saved your profile notes.')
-    elif q in ('exit', 'quit', 'bye'):
-        speak('Goodbye!')
-        sys.exit(0)
-    else:
-        # Default to AI response
-        resp = ai_response(query, history)
-        # Optionally store reply in history
-        history.append({'jarvis': resp, 'time': time.time()})
-        save_history(history)
+    for pattern, handler in _INTENTS:
+        m = pattern.search(q)
+        if m:
+            handler(m)
+            return
+
+    # Default to AI response
+    resp = ai_response(query, history)
+    add_history('jarvis', resp, now)
 
 # Entry point
 if __name__ == '__main__':
@@ -498,4 +1208,5 @@ if __name__ == '__main__':
                 continue
             process_query(cmd)
     except KeyboardInterrupt:
+        flush_history()
         speak('Shutting down. Goodbye!')
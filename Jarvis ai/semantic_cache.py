@@ -0,0 +1,159 @@
+"""
+Semantic response cache for Jarvis.
+
+Answers paraphrased prompts ("what's the weather?" / "tell me the weather")
+from a local store instead of calling OpenAI again. Prompts are embedded with
+a small sentence-transformers model and looked up by cosine similarity in a
+sqlite database using the sqlite-vec `vec0` virtual table.
+
+Both sentence-transformers and sqlite-vec are optional: when either is missing
+the cache reports itself unavailable and every lookup is a miss.
+"""
+
+import re
+import time
+import sqlite3
+import logging
+import threading
+import importlib.util
+from pathlib import Path
+
+DB_FILE = Path('semantic_cache.db')
+EMBED_MODEL = 'sentence-transformers/all-MiniLM-L6-v2'
+EMBED_DIM = 384
+# Nearest neighbours fetched per lookup; several so we can filter by user/TTL
+_KNN = 4
+
+# Prompts whose answer depends on the current moment or exact input
+_VOLATILE_RE = re.compile(r'\b(?:time|date|today|now|calculate)\b|\bwhat is \d', re.IGNORECASE)
+
+
+def is_volatile(prompt):
+    """Return True for prompts that must never be answered from a cache."""
+    return bool(_VOLATILE_RE.search(prompt or ''))
+
+
+class SemanticCache:
+    def __init__(self, path=DB_FILE, threshold=0.90, ttl=86400):
+        self.path = Path(path)
+        self.threshold = threshold
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._db = None
+        self._model = None
+        self._warming = False
+        # sentence-transformers pulls in torch; only check it is installed here
+        # and defer the actual import to warm() or the first lookup
+        self._failed = (importlib.util.find_spec('sqlite_vec') is None
+                        or importlib.util.find_spec('sentence_transformers') is None)
+
+    @property
+    def available(self):
+        return not self._failed
+
+    def _ensure(self):
+        # Model and database are opened on first use, not at import
+        if self._db is not None or self._failed:
+            return not self._failed
+        try:
+            import sqlite_vec
+            from sentence_transformers import SentenceTransformer
+            self._model = SentenceTransformer(EMBED_MODEL)
+            db = sqlite3.connect(str(self.path), check_same_thread=False)
+            db.enable_load_extension(True)
+            sqlite_vec.load(db)
+            db.enable_load_extension(False)
+            db.execute(f'CREATE VIRTUAL TABLE IF NOT EXISTS cache USING vec0('
+                       f'embedding float[{EMBED_DIM}] distance_metric=cosine)')
+            db.execute('CREATE TABLE IF NOT EXISTS entries ('
+                       'id INTEGER PRIMARY KEY, user TEXT, response TEXT, created REAL)')
+            db.commit()
+            self._db = db
+            return True
+        except Exception as e:
+            logging.info(f'Semantic cache disabled: {e}')
+            self._failed = True
+            return False
+
+    def warm(self):
+        """Load the model and open the database on a background thread.
+
+        Until that finishes, lookups miss and stores are skipped rather than
+        stalling the caller behind a multi-second model load.
+        """
+        if self._failed or self._warming or self._db is not None:
+            return
+
+        def run():
+            with self._lock:
+                if self._ensure():
+                    self._prune()
+            self._warming = False
+
+        self._warming = True
+        threading.Thread(target=run, name='semantic-cache-warm', daemon=True).start()
+
+    def _prune(self):
+        # Expired rows would otherwise pile up and crowd the _KNN nearest
+        # neighbours, turning paraphrase lookups into permanent misses
+        if not self.ttl:
+            return
+        try:
+            cutoff = time.time() - self.ttl
+            self._db.execute('DELETE FROM cache WHERE rowid IN '
+                             '(SELECT id FROM entries WHERE created < ?)', [cutoff])
+            self._db.execute('DELETE FROM entries WHERE created < ?', [cutoff])
+            self._db.commit()
+        except Exception as e:
+            logging.info(f'Semantic cache prune error: {e}')
+
+    def _embed(self, prompt):
+        emb = self._model.encode(prompt, normalize_embeddings=True)
+        return emb.astype('float32').tobytes()
+
+    def lookup(self, prompt, user='default'):
+        """Return a cached response for a similar prompt, or None."""
+        if not prompt or self._warming or is_volatile(prompt):
+            return None
+        with self._lock:
+            if not self._ensure():
+                return None
+            try:
+                emb = self._embed(prompt)
+                rows = self._db.execute(
+                    'SELECT e.response, e.user, e.created, c.distance '
+                    'FROM (SELECT rowid, distance FROM cache WHERE embedding MATCH ? AND k = ?) c '
+                    'JOIN entries e ON e.id = c.rowid ORDER BY c.distance',
+                    [emb, _KNN]).fetchall()
+            except Exception as e:
+                logging.info(f'Semantic cache lookup error: {e}')
+                return None
+        now = time.time()
+        for response, row_user, created, distance in rows:
+            if row_user != user:
+                continue
+            if self.ttl and now - created > self.ttl:
+                continue
+            if 1 - distance >= self.threshold:
+                return response
+            break
+        return None
+
+    def store(self, prompt, response, user='default'):
+        """Remember `response` for `prompt`."""
+        if not prompt or not response or self._warming or is_volatile(prompt):
+            return
+        with self._lock:
+            if not self._ensure():
+                return
+            self._prune()
+            try:
+                emb = self._embed(prompt)
+                cur = self._db.execute(
+                    'INSERT INTO entries (user, response, created) VALUES (?, ?, ?)',
+                    [user, response, time.time()])
+                self._db.execute('INSERT INTO cache (rowid, embedding) VALUES (?, ?)',
+                                 [cur.lastrowid, emb])
+                self._db.commit()
+            except Exception as e:
+                logging.info(f'Semantic cache store error: {e}')
@@ -1,11 +1,49 @@
 from flask import Flask, render_template, request, jsonify
+from flask.json.provider import DefaultJSONProvider
+import os
+import sys
 import threading
 import traceback
 
-# Import the core assistant functions
-import main_fixed as core
+try:
+    from waitress import serve
+except Exception:
+    serve = None
+
+try:
+    import orjson
+except Exception:
+    orjson = None
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Route jsonify() and request.get_json() through orjson."""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 
 app = Flask(__name__, template_folder='web_frontend/templates', static_folder='web_frontend/static')
+if orjson is not None:
+    app.json = OrjsonProvider(app)
+
+
+def get_core():
+    """Import the assistant core on first use rather than at server start.
+
+    main_fixed calls sys.exit() when config.json is missing or invalid; that is
+    turned into a RuntimeError so a request gets a 500 instead of silently
+    killing its worker thread.
+    """
+    try:
+        import main_fixed
+    except SystemExit as e:
+        app.logger.error('Jarvis core failed to load (exit code %s); check config.json.', e.code)
+        raise RuntimeError('Jarvis core failed to load; check config.json and the server log.') from None
+    return main_fixed
 
 
 @app.route('/')
@@ -21,7 +59,7 @@ def api_chat():
         if not message:
             return jsonify({'error': 'empty message'}), 400
         # Call the assistant's ai_response function (synchronous)
-        reply = core.ai_response(message)
+        reply = get_core().ai_response(message)
         return jsonify({'reply': reply})
     except Exception as e:
         traceback.print_exc()
@@ -31,13 +69,28 @@ def api_chat():
 @app.route('/api/history', methods=['GET'])
 def api_history():
     try:
-        return jsonify(core.history)
+        return jsonify(list(get_core().history))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
 def run_server():
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    # Fail at boot, not on the first request, if the config is unusable
+    try:
+        get_core()
+    except RuntimeError as e:
+        print(e)
+        sys.exit(1)
+    # JARVIS_DEBUG=1/true/yes keeps the Flask dev server with debugger and
+    # reloader, bound to localhost only since the debugger can run code.
+    # Otherwise serve from a waitress thread pool; ai_response is I/O-bound
+    # (OpenAI HTTP), so threads give real concurrency despite the GIL.
+    if os.environ.get('JARVIS_DEBUG', '').strip().lower() in ('1', 'true', 'yes'):
+        app.run(host='127.0.0.1', port=5000, debug=True)
+    elif serve is not None:
+        serve(app, host='0.0.0.0', port=5000, threads=8)
+    else:
+        app.run(host='0.0.0.0', port=5000, threaded=True)
 
 
 if __name__ == '__main__':